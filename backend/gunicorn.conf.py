@@ -0,0 +1,12 @@
+"""Gunicorn settings for production: `gunicorn main:app -c gunicorn.conf.py`"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", 2 * multiprocessing.cpu_count() + 1))
+# Workers inherit this and split the cores between their planner/execution pools
+os.environ["WEB_CONCURRENCY"] = str(workers)
+worker_class = "uvicorn.workers.UvicornWorker"
+loglevel = os.environ.get("LOG_LEVEL", "warning").lower()
+timeout = 60
+graceful_timeout = 30
@@ -0,0 +1,40 @@
+"""Numeric kernels for trajectory post-processing.
+
+Numba is opt-in: it is not in requirements.txt, so by default the NumPy
+fallbacks (same signatures) are what runs. Install numba to have the kernels
+compiled instead.
+"""
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _finalize_points_py(xs: np.ndarray, ys: np.ndarray, angles: np.ndarray,
+                        wall_width: float, wall_height: float):
+    """Clamp points onto the wall and normalize angles to [0, 360), in place"""
+    np.clip(xs, 0.0, wall_width, out=xs)
+    np.clip(ys, 0.0, wall_height, out=ys)
+    np.mod(angles, 360.0, out=angles)
+
+
+if njit is not None:
+    # Serial on purpose: a trajectory is a few hundred points, less than the
+    # cost of starting parallel threads
+    @njit(cache=True, fastmath=True)
+    def finalize_points(xs, ys, angles, wall_width, wall_height):
+        """Clamp points onto the wall and normalize angles to [0, 360), in place"""
+        for i in range(xs.shape[0]):
+            xs[i] = min(max(xs[i], 0.0), wall_width)
+            ys[i] = min(max(ys[i], 0.0), wall_height)
+            angles[i] = angles[i] % 360.0
+else:
+    finalize_points = _finalize_points_py
+
+
+def warm_up():
+    """Trigger JIT compilation (or cache load) before the first real request"""
+    dummy = np.zeros(4)
+    finalize_points(dummy.copy(), dummy.copy(), dummy.copy(), 1.0, 1.0)
@@ -1,42 +1,143 @@
+import asyncio
+import itertools
 import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
 import time
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Type
 import math
 import sqlite3
-import json
-from contextlib import contextmanager
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Depends, Header
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import Headers
+import anyio.to_thread
+import numpy as np
+import orjson
 import uvicorn
 
 from models import (
     TrajectoryRequest, SaveTrajectoryRequest, TrajectoryPoint,Obstacle
 )
+from jit_kernels import warm_up
+from planner_worker import init_worker, plan
 from services import (
-    CoveragePlanner, DatabaseManager, RobotActionLogger, MessageBroker
+    DatabaseManager, RobotActionLogger, MessageBroker, RequestLogHandler,
+    load_trajectory, rows_as_dicts, trajectory_to_array
 )
 
-# Configure logging
+# SQL for the endpoint queries, kept as constants so each connection's statement cache reuses them
+_SQL_GET_EXEC_STATS = '''
+    SELECT trajectory_count, request_count, total_execution_time
+    FROM exec_stats
+    WHERE id = 1
+'''
+_SQL_GET_RECENT_LOGS = '''
+    SELECT level, message, timestamp 
+    FROM system_logs 
+    ORDER BY timestamp DESC 
+    LIMIT 10
+'''
+_SQL_GET_TRAJECTORY_DATA = '''
+    SELECT trajectory_data FROM trajectories WHERE id = ?
+'''
+_SQL_TRAJECTORY_EXISTS = "SELECT id FROM trajectories WHERE id = ?"
+_SQL_DELETE_TRAJECTORY = "DELETE FROM trajectories WHERE id = ?"
+_SQL_GET_ROBOT_ACTIONS = '''
+    SELECT action_type, details, timestamp 
+    FROM robot_actions 
+    WHERE session_id = ?
+    ORDER BY timestamp ASC, id ASC
+'''
+_SQL_GET_MESSAGES = '''
+    SELECT message, status, created_at, processed_at 
+    FROM message_queue 
+    WHERE topic = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+'''
+
+# Configure logging: request threads only enqueue records, a background
+# QueueListener thread does the file, console and database writes.
+# LOG_LEVEL (e.g. WARNING in production) gates the file and console output.
+LOG_LEVEL_NAME = os.environ.get("LOG_LEVEL", "INFO").upper()
+# getLevelName returns a "Level X" string rather than raising for unknown names
+LOG_LEVEL = logging.getLevelName(LOG_LEVEL_NAME)
+_unknown_log_level = not isinstance(LOG_LEVEL, int)
+if _unknown_log_level:
+    LOG_LEVEL = logging.INFO
+log_queue = queue.SimpleQueue()
+queue_handler = logging.handlers.QueueHandler(log_queue)
+
+# Per-process request ids: a counter is collision-free and needs no clock read,
+# and the ContextVar carries the id into everything the request awaits
+_REQ_ID = itertools.count()
+request_id_ctx: ContextVar[Optional[int]] = ContextVar("request_id", default=None)
+
+class RequestIdFilter(logging.Filter):
+    """Stamp every record with the id of the request it was logged under"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_ctx.get()
+        return True
+
+queue_handler.addFilter(RequestIdFilter())
 logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('robot_control.log'),
-        logging.StreamHandler()
-    ]
+    level=LOG_LEVEL,
+    format='%(message)s',
+    handlers=[queue_handler]
 )
+log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+file_handler = logging.FileHandler('robot_control.log')
+file_handler.setFormatter(log_formatter)
+file_handler.setLevel(LOG_LEVEL)
+stream_handler = logging.StreamHandler()
+stream_handler.setFormatter(log_formatter)
+stream_handler.setLevel(LOG_LEVEL)
 logger = logging.getLogger("WallFinishingRobot")
+# Request completion records are INFO and always reach the database handler
+logger.setLevel(min(LOG_LEVEL, logging.INFO))
+logger.addHandler(queue_handler)
+logger.propagate = False
 logging.getLogger("watchfiles").setLevel(logging.WARNING)
+if _unknown_log_level:
+    logger.warning(f"Unknown LOG_LEVEL {LOG_LEVEL_NAME!r}, using INFO")
+
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Read-only endpoints are plain `def` and run on AnyIO's worker threads;
+    # allow more of them than the default 40 since they mostly wait on SQLite
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 100
+    # Start the planner workers now so their kernel warm-up doesn't hit the first request
+    PLANNER_POOL.submit(warm_up)
+    yield
+    PLANNER_POOL.shutdown(cancel_futures=True)
+    planner_log_listener.stop()
+    EXECUTION_POOL.shutdown(cancel_futures=True)
+    message_broker.close()
+    # Drain queued log records, then flush them to the database
+    log_listener.stop()
+    db_manager.close()
     
 # Initialize FastAPI app
 app = FastAPI(
     title="Wall-Finishing Robot Control System",
     description="Advanced trajectory planning and control system for autonomous wall finishing robots",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -48,12 +149,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class GZipExceptNDJSONMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves NDJSON requests uncompressed
+
+    Starlette gzips every streamed body regardless of minimum_size, and the
+    gzip buffer holds NDJSON lines back instead of sending each chunk as it
+    is encoded.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and "application/x-ndjson" in Headers(scope=scope).get("accept", ""):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Full-wall trajectories are repetitive JSON and compress well. minimum_size only
+# applies to non-streamed bodies, which is why generate_trajectory sends
+# single-chunk trajectories in one piece.
+app.add_middleware(GZipExceptNDJSONMiddleware, minimum_size=8192)
+
 # Initialize components
 db_manager = DatabaseManager()
-coverage_planner = CoveragePlanner()
-robot_logger = RobotActionLogger(db_manager)
+# ROBOT_SIM_DELAY: simulated seconds per trajectory point during execution (0 = no pacing)
+robot_logger = RobotActionLogger(db_manager, simulate_delay_s=float(os.environ.get("ROBOT_SIM_DELAY", "0")))
 message_broker = MessageBroker(db_manager)
 
+# The pools below exist once per server worker process, so by default the
+# WEB_CONCURRENCY server workers split the cores between them;
+# PLANNER_WORKERS / EXECUTION_WORKERS override the per-process sizes
+_SERVER_WORKERS = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+_POOL_SHARE = max(1, (os.cpu_count() or 1) // _SERVER_WORKERS)
+PLANNER_WORKERS = int(os.environ.get("PLANNER_WORKERS", _POOL_SHARE))
+EXECUTION_WORKERS = int(os.environ.get("EXECUTION_WORKERS", _POOL_SHARE))
+
+# Robot simulations run here so they never tie up the event loop
+EXECUTION_POOL = ThreadPoolExecutor(max_workers=EXECUTION_WORKERS)
+
+# Trajectory planning is CPU-bound pure Python, so it gets its own processes.
+# They are spawned: a fork of this process would inherit the writer and listener
+# threads' locks and an undrained log queue. Their records come back over
+# planner_log_queue and join the main log queue here.
+_planner_context = multiprocessing.get_context("spawn")
+planner_log_queue = _planner_context.Queue()
+PLANNER_POOL = ProcessPoolExecutor(
+    max_workers=PLANNER_WORKERS,
+    mp_context=_planner_context,
+    initializer=init_worker,
+    initargs=(planner_log_queue, logger.level)
+)
+planner_log_listener = logging.handlers.QueueListener(planner_log_queue, queue_handler)
+planner_log_listener.start()
+
+log_listener = logging.handlers.QueueListener(
+    log_queue,
+    file_handler,
+    stream_handler,
+    RequestLogHandler(db_manager),
+    respect_handler_level=True
+)
+log_listener.start()
+
 # Set up message broker subscriptions
 def handle_trajectory_command(message):
     logger.info(f"Processing trajectory command: {message}")
@@ -68,25 +223,25 @@ message_broker.subscribe("robot_status", handle_robot_status)
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     start_time = time.time()
-    request_id = f"{int(time.time() * 1000)}"
+    request_id = next(_REQ_ID)
+    request_id_ctx.set(request_id)
     
     # Log incoming request
-    logger.info(f"Request {request_id}: {request.method} {request.url}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Request {request_id}: {request.method} {request.url}")
     
     response = await call_next(request)
     
     # Calculate execution time
     execution_time = time.time() - start_time
     
-    # Log response
-    logger.info(f"Request {request_id} completed in {execution_time:.3f}s with status {response.status_code}")
-    
-    # Save to database
-    db_manager.log_request(
-        level="INFO",
-        message=f"{request.method} {request.url} - {response.status_code}",
-        request_id=request_id,
-        execution_time=execution_time
+    # Log response; RequestLogHandler persists it to the database off the request path
+    logger.info(
+        f"Request {request_id} completed in {execution_time:.3f}s with status {response.status_code}",
+        extra={
+            "execution_time": execution_time,
+            "summary": f"{request.method} {request.url} - {response.status_code}"
+        }
     )
     
     return response
@@ -100,92 +255,149 @@ async def root():
         "timestamp": datetime.now().isoformat()
     }
 
+# Points encoded per chunk of a streamed /generate_trajectory response (~70 KB of JSON)
+STREAM_CHUNK_POINTS = 1024
+
+def _stream_trajectory(points: np.ndarray, metadata: Dict[str, Any], chunk_size: int = STREAM_CHUNK_POINTS):
+    """Encode the response in chunks of points so the full JSON is never held in memory"""
+    fields = points.dtype.names
+    yield b'{"success":true,"trajectory":['
+    for start in range(0, len(points), chunk_size):
+        chunk = [dict(zip(fields, point)) for point in points[start:start + chunk_size].tolist()]
+        encoded = orjson.dumps(chunk)[1:-1]
+        yield encoded if start == 0 else b"," + encoded
+    yield b'],"metadata":' + orjson.dumps(metadata) + b"}"
+
+def _stream_trajectory_ndjson(points: np.ndarray, metadata: Dict[str, Any], chunk_size: int = STREAM_CHUNK_POINTS):
+    """Encode the response as NDJSON: a metadata line, then one line per point"""
+    fields = points.dtype.names
+    yield orjson.dumps({"success": True, "metadata": metadata}) + b"\n"
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size].tolist()
+        yield b"".join(orjson.dumps(dict(zip(fields, point))) + b"\n" for point in chunk)
+
 @app.post("/generate_trajectory")
-async def generate_trajectory(request: TrajectoryRequest, req: Request):
-    """Generate trajectory for wall finishing with configurable tool parameters"""
-    request_id = id(request)
-    logger.info(f"Request {request_id}: POST {req.url}")
-    
+async def generate_trajectory(request: TrajectoryRequest, accept: Optional[str] = Header(default=None)):
+    """Generate trajectory for wall finishing with configurable tool parameters
+
+    Responds with NDJSON (metadata line, then one point per line) when the client
+    sends Accept: application/x-ndjson, otherwise with a single JSON document.
+    """
     start_time = time.time()
     
     try:
-        logger.info(f"Generating trajectory for {request.wall_width}x{request.wall_height}m wall")
-        logger.info(f"Tool parameters: width={request.tool_width}m, overlap={request.overlap}m")
-        logger.info(f"Obstacles: {len(request.obstacles)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Generating trajectory for {request.wall_width}x{request.wall_height}m wall")
+            logger.debug(f"Tool parameters: width={request.tool_width}m, overlap={request.overlap}m")
+            logger.debug(f"Obstacles: {len(request.obstacles)}")
         
-        # Create coverage planner with custom parameters
-        coverage_planner = CoveragePlanner(
-            tool_width=request.tool_width,
-            overlap=request.overlap,
-            safety_margin=request.safety_margin
-        )
+        # Pack obstacles into one (N, 4) array for vectorized collision checks
+        obstacles = np.asarray(
+            [(o.x, o.y, o.width, o.height) for o in request.obstacles], dtype=np.float64
+        ).reshape(-1, 4)
         
-        # Generate trajectory points
-        trajectory_points = coverage_planner.generate_coverage_pattern(
-            request.wall_width, 
-            request.wall_height, 
-            request.obstacles
+        # Generate trajectory points off the event loop
+        trajectory_points = await asyncio.get_running_loop().run_in_executor(
+            PLANNER_POOL,
+            plan,
+            request.wall_width,
+            request.wall_height,
+            obstacles,
+            request.tool_width,
+            request.overlap,
+            request.safety_margin
         )
         
-        # Convert to response format
-        trajectory_data = [
-            {
-                "x": point.x,
-                "y": point.y,
-                "angle": point.angle,
-                "speed": point.speed,
-                "tool_active": point.tool_active
-            }
-            for point in trajectory_points
-        ]
-        
         execution_time = time.time() - start_time
-        logger.info(f"Trajectory generation completed in {execution_time:.3f}s with {len(trajectory_data)} points")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Trajectory generation completed in {execution_time:.3f}s with {len(trajectory_points)} points")
         
-        return {
-            "success": True,
-            "trajectory": trajectory_data,
-            "metadata": {
-                "wall_dimensions": f"{request.wall_width}x{request.wall_height}m",
-                "tool_config": {
-                    "tool_width": request.tool_width,
-                    "overlap": request.overlap,
-                    "safety_margin": request.safety_margin,
-                    "effective_width": request.tool_width - request.overlap
-                },
-                "obstacles_count": len(request.obstacles),
-                "points_count": len(trajectory_data),
-                "generation_time": f"{execution_time:.3f}s"
-            }
+        metadata = {
+            "wall_dimensions": f"{request.wall_width}x{request.wall_height}m",
+            "tool_config": {
+                "tool_width": request.tool_width,
+                "overlap": request.overlap,
+                "safety_margin": request.safety_margin,
+                "effective_width": request.tool_width - request.overlap
+            },
+            "obstacles_count": len(request.obstacles),
+            "points_count": len(trajectory_points),
+            "generation_time": f"{execution_time:.3f}s"
         }
+        if accept and "application/x-ndjson" in accept:
+            return StreamingResponse(
+                _stream_trajectory_ndjson(trajectory_points, metadata),
+                media_type="application/x-ndjson"
+            )
+        if len(trajectory_points) <= STREAM_CHUNK_POINTS:
+            # One chunk anyway: send it as a plain body so small replies skip gzip
+            return Response(
+                b"".join(_stream_trajectory(trajectory_points, metadata)),
+                media_type="application/json"
+            )
+        return StreamingResponse(
+            _stream_trajectory(trajectory_points, metadata),
+            media_type="application/json"
+        )
         
     except Exception as e:
         execution_time = time.time() - start_time
         logger.error(f"Trajectory generation failed after {execution_time:.3f}s: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Trajectory generation failed: {str(e)}")
-    
-    finally:
-        execution_time = time.time() - start_time
-        logger.info(f"Request {request_id} completed in {execution_time:.3f}s with status {200 if 'trajectory_data' in locals() else 500}")
 
-@app.post("/save_trajectory")
-async def save_trajectory(request: SaveTrajectoryRequest):
+def json_body(model: Type[BaseModel]):
     """
-    Save generated trajectory to database for future reference
+    Dependency that validates the raw body with pydantic-core's JSON parser,
+    skipping the intermediate json.loads + dict walk FastAPI does for body params
     """
+    async def parse(request: Request):
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError([
+                {**error, "loc": ("body", *error["loc"])}
+                for error in e.errors(include_url=False)
+            ])
+    return parse
+
+def json_body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAPI request body for endpoints that parse with json_body"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}}
+        }
+    }
+
+@app.post("/save_trajectory", status_code=202, openapi_extra=json_body_schema(SaveTrajectoryRequest))
+def save_trajectory(request: SaveTrajectoryRequest = Depends(json_body(SaveTrajectoryRequest))):
+    """
+    Queue a generated trajectory for saving; poll /trajectory/{id}/status until it is "saved"
+    """
+    # The trajectories table CHECKs these too, but the row is written after we
+    # have already answered, so reject bad dimensions here while we still can
+    if request.wall_width <= 0 or request.wall_height <= 0:
+        raise HTTPException(status_code=422, detail="Wall dimensions must be positive")
+    # Same for the points: the writer only encodes them, so a malformed one fails here
+    try:
+        points = trajectory_to_array(request.trajectory)
+    except KeyError as e:
+        raise HTTPException(status_code=422, detail=f"Every trajectory point needs {e}")
+    
     try:
         trajectory_id = db_manager.save_trajectory(
             request.wall_width,
             request.wall_height,
             request.obstacles,
-            request.trajectory
+            points
         )
         
-        logger.info(f"Trajectory saved with ID: {trajectory_id}")
+        logger.info(f"Trajectory queued with ID: {trajectory_id}")
         
         return {
             "id": trajectory_id,
-            "message": "Trajectory saved successfully",
+            "status": "queued",
+            "message": "Trajectory accepted for saving",
             "timestamp": datetime.now().isoformat()
         }
         
@@ -193,8 +405,18 @@ async def save_trajectory(request: SaveTrajectoryRequest):
         logger.error(f"Failed to save trajectory: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to save trajectory: {str(e)}")
 
+@app.get("/trajectory/{trajectory_id}/status")
+def get_trajectory_status(trajectory_id: int):
+    """
+    Report whether a saved trajectory is still queued, stored, or failed to write
+    """
+    status = db_manager.trajectory_status(trajectory_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Trajectory not found")
+    return {"id": trajectory_id, "status": status}
+
 @app.get("/trajectories")
-async def get_trajectories(limit: int = 10):
+def get_trajectories(limit: int = 10):
     """
     Retrieve saved trajectories with metadata
     """
@@ -212,29 +434,19 @@ async def get_trajectories(limit: int = 10):
         raise HTTPException(status_code=500, detail=f"Failed to retrieve trajectories: {str(e)}")
 
 @app.get("/system_status")
-async def get_system_status():
+def get_system_status():
     """
     Get system status and performance metrics
     """
     try:
         with db_manager.get_connection() as conn:
-            # Get trajectory count
-            trajectory_count = conn.execute("SELECT COUNT(*) FROM trajectories").fetchone()[0]
+            # Get trajectory count and request timing totals (maintained incrementally)
+            trajectory_count, request_count, total_execution_time = conn.execute(_SQL_GET_EXEC_STATS).fetchone()
             
             # Get recent logs
-            recent_logs = conn.execute('''
-                SELECT level, message, timestamp 
-                FROM system_logs 
-                ORDER BY timestamp DESC 
-                LIMIT 10
-            ''').fetchall()
-            
-            # Get average execution time
-            avg_execution = conn.execute('''
-                SELECT AVG(execution_time) 
-                FROM system_logs 
-                WHERE execution_time IS NOT NULL
-            ''').fetchone()[0]
+            recent_logs = rows_as_dicts(conn.execute(_SQL_GET_RECENT_LOGS))
+        
+        avg_execution = total_execution_time / request_count if request_count else 0
         
         return {
             "status": "operational",
@@ -243,29 +455,42 @@ async def get_system_status():
                 "average_request_time": round(avg_execution or 0, 3),
                 "uptime": "N/A"  # Would need startup time tracking
             },
-            "recent_logs": [dict(log) for log in recent_logs]
+            "recent_logs": recent_logs
         }
         
     except Exception as e:
         logger.error(f"Failed to get system status: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get system status: {str(e)}")
     
+def run_trajectory_execution(trajectory_id: int, trajectory_data: np.ndarray, session_id: int):
+    """Simulate a trajectory and publish the outcome (runs on EXECUTION_POOL)"""
+    try:
+        robot_logger.simulate_robot_execution(trajectory_data, session_id)
+        message_broker.publish("robot_status", f"Completed execution of trajectory {trajectory_id}", priority=8)
+    except Exception as e:
+        logger.error(f"Execution of trajectory {trajectory_id} failed: {str(e)}")
+        message_broker.publish("robot_status", f"Failed execution of trajectory {trajectory_id}", priority=8)
+
+async def execute_in_background(trajectory_id: int, trajectory_data: np.ndarray, session_id: int):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        EXECUTION_POOL, run_trajectory_execution, trajectory_id, trajectory_data, session_id
+    )
+
 @app.post("/execute_trajectory/{trajectory_id}")
-async def execute_trajectory(trajectory_id: int):
+async def execute_trajectory(trajectory_id: int, background: BackgroundTasks):
     """
-    Simulate robot execution with detailed action logging
+    Start simulated robot execution; poll /robot_actions/{session_id} for progress
     """
     try:
         with db_manager.get_connection() as conn:
-            cursor = conn.execute('''
-                SELECT trajectory_data FROM trajectories WHERE id = ?
-            ''', (trajectory_id,))
+            cursor = conn.execute(_SQL_GET_TRAJECTORY_DATA, (trajectory_id,))
             result = cursor.fetchone()
             
             if not result:
                 raise HTTPException(status_code=404, detail="Trajectory not found")
             
-            trajectory_data = json.loads(result[0])
+            trajectory_data = load_trajectory(result[0])
         
         # Start execution session
         session_id = robot_logger.start_execution_session(trajectory_id)
@@ -273,17 +498,14 @@ async def execute_trajectory(trajectory_id: int):
         # Publish start message
         message_broker.publish("robot_status", f"Starting execution of trajectory {trajectory_id}", priority=8)
         
-        # Simulate execution with detailed logging
-        robot_logger.simulate_robot_execution(trajectory_data)
-        
-        # Publish completion message
-        message_broker.publish("robot_status", f"Completed execution of trajectory {trajectory_id}", priority=8)
+        # Simulate execution with detailed logging once the response is sent
+        background.add_task(execute_in_background, trajectory_id, trajectory_data, session_id)
         
         return {
             "session_id": session_id,
-            "status": "completed",
+            "status": "running",
             "trajectory_id": trajectory_id,
-            "points_executed": len(trajectory_data)
+            "total_points": len(trajectory_data)
         }
         
     except Exception as e:
@@ -298,13 +520,13 @@ async def delete_trajectory(trajectory_id: int):
     try:
         with db_manager.get_connection() as conn:
             # Check if the trajectory exists
-            cursor = conn.execute("SELECT id FROM trajectories WHERE id = ?", (trajectory_id,))
+            cursor = conn.execute(_SQL_TRAJECTORY_EXISTS, (trajectory_id,))
             result = cursor.fetchone()
             if not result:
                 raise HTTPException(status_code=404, detail="Trajectory not found")
             
             # Delete the trajectory
-            conn.execute("DELETE FROM trajectories WHERE id = ?", (trajectory_id,))
+            conn.execute(_SQL_DELETE_TRAJECTORY, (trajectory_id,))
             conn.commit()
         
         logger.info(f"Trajectory {trajectory_id} deleted successfully")
@@ -316,19 +538,14 @@ async def delete_trajectory(trajectory_id: int):
     
 
 @app.get("/robot_actions/{session_id}")
-async def get_robot_actions(session_id: str):
+def get_robot_actions(session_id: int):
     """
     Get detailed robot actions for a specific session
     """
     try:
         with db_manager.get_connection() as conn:
-            cursor = conn.execute('''
-                SELECT action_type, details, timestamp 
-                FROM robot_actions 
-                WHERE session_id = ?
-                ORDER BY timestamp ASC
-            ''', (session_id,))
-            actions = [dict(row) for row in cursor.fetchall()]
+            cursor = conn.execute(_SQL_GET_ROBOT_ACTIONS, (session_id,))
+            actions = rows_as_dicts(cursor)
         
         return {
             "session_id": session_id,
@@ -341,20 +558,16 @@ async def get_robot_actions(session_id: str):
         raise HTTPException(status_code=500, detail=f"Failed to retrieve robot actions: {str(e)}")
 
 @app.get("/messages/{topic}")
-async def get_messages(topic: str, limit: int = 50):
+def get_messages(topic: str, limit: int = 50):
     """
     Get messages from message broker queue
     """
     try:
+        # Include messages still waiting in the broker's write buffer
+        message_broker.flush()
         with db_manager.get_connection() as conn:
-            cursor = conn.execute('''
-                SELECT message, status, created_at, processed_at 
-                FROM message_queue 
-                WHERE topic = ?
-                ORDER BY created_at DESC
-                LIMIT ?
-            ''', (topic, limit))
-            messages = [dict(row) for row in cursor.fetchall()]
+            cursor = conn.execute(_SQL_GET_MESSAGES, (topic, limit))
+            messages = rows_as_dicts(cursor)
         
         return {
             "topic": topic,
@@ -384,10 +597,26 @@ async def process_pending_messages():
 
 if __name__ == "__main__":
     logger.info("Starting Wall-Finishing Robot Control System API")
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+    if os.environ.get("APP_ENV") == "dev":
+        # Single worker with the file watcher, for local development only
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
+    else:
+        # "auto" picks uvloop/httptools when uvicorn[standard] is installed.
+        # Containers should prefer gunicorn with gunicorn.conf.py instead.
+        # The worker processes read WEB_CONCURRENCY to size their pools.
+        workers = int(os.environ.setdefault("WEB_CONCURRENCY", str(2 * (os.cpu_count() or 1) + 1)))
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=workers,
+            loop="auto",
+            http="auto",
+            log_level="warning"
+        )
@@ -1,3 +1,4 @@
+import numpy as np
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any
 
@@ -23,6 +24,15 @@ class TrajectoryPoint(BaseModel):
     speed: float = 0.1
     tool_active: bool = True  # NEW FLAG!
 
+# Contiguous layout of a generated trajectory, one record per TrajectoryPoint
+TRAJECTORY_DTYPE = np.dtype([
+    ("x", "f8"),
+    ("y", "f8"),
+    ("angle", "f8"),
+    ("speed", "f8"),
+    ("tool_active", "?")
+])
+
 class SaveTrajectoryRequest(BaseModel):
     wall_width: float
     wall_height: float
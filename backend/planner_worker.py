@@ -0,0 +1,42 @@
+"""Code that runs inside the PLANNER_POOL worker processes.
+
+The pool spawns its workers instead of forking the threaded API process, so
+they start clean: they import this module and what it needs, and
+init_worker routes their log records back to the parent over a queue.
+"""
+import logging
+import logging.handlers
+from functools import lru_cache
+
+import numpy as np
+
+from jit_kernels import finalize_points, warm_up
+from services import CoveragePlanner
+
+
+def init_worker(log_queue, log_level: int):
+    """Pool initializer: send this process's log records to log_queue, then warm up the kernels"""
+    logger = logging.getLogger("WallFinishingRobot")
+    logger.handlers[:] = [logging.handlers.QueueHandler(log_queue)]
+    logger.setLevel(log_level)
+    logger.propagate = False
+    warm_up()
+
+
+@lru_cache(maxsize=32)
+def _planner_for(tool_width_q: int, overlap_q: int, safety_margin_q: int) -> CoveragePlanner:
+    """Reuse planners per tool configuration, keyed on values quantized to 1e-4 m"""
+    return CoveragePlanner(
+        tool_width=tool_width_q / 1e4,
+        overlap=overlap_q / 1e4,
+        safety_margin=safety_margin_q / 1e4
+    )
+
+
+def plan(wall_width: float, wall_height: float, obstacles: np.ndarray,
+         tool_width: float, overlap: float, safety_margin: float) -> np.ndarray:
+    """Run the coverage planner (the structured array pickles back as one buffer)"""
+    planner = _planner_for(round(tool_width * 1e4), round(overlap * 1e4), round(safety_margin * 1e4))
+    points = planner.generate_coverage_pattern(wall_width, wall_height, obstacles)
+    finalize_points(points["x"], points["y"], points["angle"], wall_width, wall_height)
+    return points
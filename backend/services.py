@@ -1,27 +1,224 @@
+import abc
 import sqlite3
-import json
+import struct
 import time
 import logging
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+import math
+import threading
+import weakref
+import zlib
+from bisect import bisect_left, bisect_right
+from typing import List, Optional, Dict, Any, Union
 from contextlib import contextmanager
-from models import TrajectoryPoint, Obstacle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import orjson
+from models import TrajectoryPoint, TRAJECTORY_DTYPE
 
 logger = logging.getLogger("WallFinishingRobot")
 
+# SQL for the hot insert/select paths, kept as constants so each pooled
+# connection's statement cache reuses the prepared statements
+_SQL_RESERVE_TRAJECTORY_ID = '''
+    UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = 'trajectories' RETURNING seq
+'''
+_SQL_QUEUE_TRAJECTORY_SAVE = "INSERT INTO trajectory_saves (id, status) VALUES (?, 'queued')"
+_SQL_CLEAR_TRAJECTORY_SAVE = "DELETE FROM trajectory_saves WHERE id = ?"
+_SQL_FAIL_TRAJECTORY_SAVE = '''
+    UPDATE trajectory_saves SET status = 'failed', updated_at = CURRENT_TIMESTAMP WHERE id = ?
+'''
+_SQL_PRUNE_FAILED_SAVES = '''
+    DELETE FROM trajectory_saves WHERE status = 'failed' AND updated_at < datetime('now', '-1 day')
+'''
+_SQL_TRAJECTORY_STATUS = '''
+    SELECT COALESCE(
+        (SELECT status FROM trajectory_saves WHERE id = ?1),
+        (SELECT 'saved' FROM trajectories WHERE id = ?1)
+    )
+'''
+_SQL_GET_TRAJECTORIES = '''
+    SELECT id, wall_width, wall_height, created_at, total_points, execution_time
+    FROM trajectories 
+    ORDER BY created_at DESC, id DESC
+    LIMIT ?
+'''
+_SQL_INSERT_TRAJECTORY = '''
+    INSERT INTO trajectories (id, wall_width, wall_height, obstacles, trajectory_data, total_points)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_LOG = '''
+    INSERT INTO system_logs (level, message, request_id, execution_time, timestamp)
+    VALUES (?, ?, ?, ?, ?)
+'''
+_SQL_UPDATE_EXEC_STATS = '''
+    UPDATE exec_stats
+    SET request_count = request_count + ?, total_execution_time = total_execution_time + ?
+    WHERE id = 1
+'''
+_SQL_INSERT_SESSION = "INSERT INTO sessions (trajectory_id) VALUES (?)"
+# timestamp is left to the column's CURRENT_TIMESTAMP default
+_SQL_INSERT_ACTION = '''
+    INSERT INTO robot_actions (session_id, action_type, details)
+    VALUES (?, ?, ?)
+'''
+_SQL_INSERT_MESSAGE = '''
+    INSERT INTO message_queue (topic, message, priority, status, processed_at)
+    VALUES (?1, ?2, ?3, ?4, CASE ?4 WHEN 'processed' THEN CURRENT_TIMESTAMP END)
+'''
+_SQL_PENDING_MESSAGES_FOR_TOPIC = '''
+    SELECT id, topic, message FROM message_queue 
+    WHERE status = 'pending' AND topic = ?
+    ORDER BY priority DESC, created_at ASC
+'''
+_SQL_PENDING_MESSAGES = '''
+    SELECT id, topic, message FROM message_queue 
+    WHERE status = 'pending'
+    ORDER BY priority DESC, created_at ASC
+'''
+# Ids are bound as one JSON array so the statement text never changes with the batch size
+_SQL_MARK_MESSAGES_PROCESSED = '''
+    UPDATE message_queue 
+    SET status = 'processed', processed_at = CURRENT_TIMESTAMP
+    WHERE id IN (SELECT value FROM json_each(?))
+'''
+
+# Stored trajectories are columnar: a magic/length header, then fixed-point
+# columns (scale, dtype) and tool_active as a packed bit column, deflated as one
+# payload. x/y keep 0.1 mm, angle 0.1 degree and speed 1 mm/s. Older rows are
+# TRJ2 (same columns, uncompressed) or TRJ1 (uncompressed float64 columns).
+_TRAJECTORY_MAGIC = b"TRJ3"
+_TRAJECTORY_MAGIC_V2 = b"TRJ2"
+_TRAJECTORY_MAGIC_V1 = b"TRJ1"
+_TRAJECTORY_COMPRESSION_LEVEL = 3
+_TRAJECTORY_HEADER = struct.Struct("<4sI")
+_TRAJECTORY_COLUMNS = (
+    ("x", 1e4, np.dtype("<i4")),
+    ("y", 1e4, np.dtype("<i4")),
+    ("angle", 1e1, np.dtype("<i2")),
+    ("speed", 1e3, np.dtype("<u2")),
+)
+_TRAJECTORY_COLUMNS_V1 = tuple((name, 1.0, np.dtype("<f8")) for name, _, _ in _TRAJECTORY_COLUMNS)
+
+def rows_as_dicts(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
+    """Fetch all rows as dicts, reading the column names once per query"""
+    keys = [column[0] for column in cursor.description]
+    return [dict(zip(keys, row)) for row in cursor.fetchall()]
+
+def trajectory_to_array(trajectory: List[Dict]) -> np.ndarray:
+    """Pack a list of point dicts into a TRAJECTORY_DTYPE array, with TrajectoryPoint defaults"""
+    points = np.empty(len(trajectory), dtype=TRAJECTORY_DTYPE)
+    points["x"] = [p["x"] for p in trajectory]
+    points["y"] = [p["y"] for p in trajectory]
+    points["angle"] = [p.get("angle", 0.0) for p in trajectory]
+    points["speed"] = [p.get("speed", 0.1) for p in trajectory]
+    points["tool_active"] = [p.get("tool_active", True) for p in trajectory]
+    return points
+
+def dump_trajectory(points: np.ndarray) -> bytes:
+    """Encode a TRAJECTORY_DTYPE array as a quantized columnar blob"""
+    columns = []
+    for name, scale, dtype in _TRAJECTORY_COLUMNS:
+        limits = np.iinfo(dtype)
+        quantized = np.clip(np.rint(points[name] * scale), limits.min, limits.max)
+        columns.append(quantized.astype(dtype).tobytes())
+    columns.append(np.packbits(points["tool_active"]).tobytes())
+    payload = zlib.compress(b"".join(columns), _TRAJECTORY_COMPRESSION_LEVEL)
+    return _TRAJECTORY_HEADER.pack(_TRAJECTORY_MAGIC, len(points)) + payload
+
+def load_trajectory(blob: Union[bytes, str]) -> np.ndarray:
+    """Decode a stored trajectory into a TRAJECTORY_DTYPE array (also reads older formats)"""
+    # Rows saved before the binary format are JSON, and come back as str from TEXT columns
+    if isinstance(blob, str) or blob[:3] != _TRAJECTORY_MAGIC[:3]:
+        return trajectory_to_array(orjson.loads(blob))
+    magic, n = _TRAJECTORY_HEADER.unpack_from(blob)
+    if magic == _TRAJECTORY_MAGIC:
+        layout, payload = _TRAJECTORY_COLUMNS, zlib.decompress(blob[_TRAJECTORY_HEADER.size:])
+    elif magic == _TRAJECTORY_MAGIC_V2:
+        layout, payload = _TRAJECTORY_COLUMNS, memoryview(blob)[_TRAJECTORY_HEADER.size:]
+    elif magic == _TRAJECTORY_MAGIC_V1:
+        layout, payload = _TRAJECTORY_COLUMNS_V1, memoryview(blob)[_TRAJECTORY_HEADER.size:]
+    else:
+        raise ValueError(f"Unknown trajectory format {magic!r}")
+    points = np.empty(n, dtype=TRAJECTORY_DTYPE)
+    offset = 0
+    for name, scale, dtype in layout:
+        points[name] = np.frombuffer(payload, dtype=dtype, count=n, offset=offset) / scale
+        offset += dtype.itemsize * n
+    packed = np.frombuffer(payload, dtype=np.uint8, offset=offset)
+    points["tool_active"] = np.unpackbits(packed, count=n).astype(bool)
+    return points
+
 class DatabaseManager:
+    # Per-connection settings, applied every time a connection is opened
+    CONNECTION_PRAGMAS = (
+        "PRAGMA synchronous=NORMAL",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA mmap_size=268435456",
+        "PRAGMA cache_size=-65536",
+        "PRAGMA busy_timeout=5000",
+    )
+    # Database files already switched to WAL by this process (the mode persists in the file)
+    _wal_enabled = set()
+
     def __init__(self, db_path: str = "robot_trajectories.db"):
         self.db_path = db_path
+        # One long-lived connection per thread keeps the page and statement caches warm.
+        # Each is closed by a finalizer once its thread is gone (AnyIO retires idle
+        # worker threads and starts new ones), so only live threads hold connections.
+        self._local = threading.local()
+        self._connections: List[weakref.finalize] = []
+        self._connections_lock = threading.Lock()
+        self.bootstrap_pragmas()
         self.init_database()
+        self.log_sink = BatchedLogSink(self)
+        self.trajectory_writer = TrajectoryWriter(self)
 
     @contextmanager
     def get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """Yield this thread's pooled connection, rolling back if the block raises"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Rows come back as plain tuples; endpoints that return objects use rows_as_dicts
+            conn = sqlite3.connect(self.db_path, cached_statements=256, check_same_thread=False)
+            for pragma in self.CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            finalizer = weakref.finalize(threading.current_thread(), conn.close)
+            with self._connections_lock:
+                self._connections = [f for f in self._connections if f.alive]
+                self._connections.append(finalizer)
         try:
             yield conn
+        except Exception:
+            conn.rollback()
+            raise
+
+    def close_all(self):
+        """Close every pooled connection; threads reconnect lazily if used again"""
+        try:
+            # Let SQLite refresh planner statistics that the session's queries showed
+            # were stale; once, on this thread's connection, as others may be in use
+            with self.get_connection() as conn:
+                conn.execute("PRAGMA optimize")
+        except sqlite3.Error as e:
+            logger.warning(f"PRAGMA optimize failed: {e}")
         finally:
-            conn.close()
+            with self._connections_lock:
+                connections, self._connections = self._connections, []
+            for finalizer in connections:
+                finalizer()
+            self._local = threading.local()
+
+    def bootstrap_pragmas(self):
+        """Switch to WAL journaling so readers don't block the writer (persists in the file)"""
+        if self.db_path in DatabaseManager._wal_enabled:
+            return
+        with self.get_connection() as conn:
+            # Larger pages keep multi-KB trajectory blobs off overflow pages; this
+            # only takes effect on a new, empty database, before WAL is enabled
+            conn.execute("PRAGMA page_size=8192")
+            conn.execute("PRAGMA journal_mode=WAL")
+        DatabaseManager._wal_enabled.add(self.db_path)
 
     def init_database(self):
         """Initialize database with required tables and indexes"""
@@ -30,15 +227,22 @@ class DatabaseManager:
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS trajectories (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    wall_width REAL NOT NULL,
-                    wall_height REAL NOT NULL,
-                    obstacles TEXT NOT NULL,
-                    trajectory_data TEXT NOT NULL,
+                    wall_width REAL NOT NULL CHECK (wall_width > 0),
+                    wall_height REAL NOT NULL CHECK (wall_height > 0),
+                    obstacles BLOB NOT NULL,
+                    trajectory_data BLOB NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     execution_time REAL,
-                    total_points INTEGER,
-                    coverage_percentage REAL,
-                    optimization_level TEXT DEFAULT 'basic'
+                    total_points INTEGER
+                )
+            ''')
+            
+            # Create execution sessions table; integer ids keep the action index small
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    trajectory_id INTEGER NOT NULL,
+                    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
             
@@ -46,7 +250,7 @@ class DatabaseManager:
             conn.execute('''
                 CREATE TABLE IF NOT EXISTS robot_actions (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    session_id TEXT NOT NULL,
+                    session_id INTEGER NOT NULL REFERENCES sessions(id),
                     action_type TEXT NOT NULL,
                     details TEXT NOT NULL,
                     timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -72,12 +276,25 @@ class DatabaseManager:
             
             # Create indexes for better query performance
             conn.execute('CREATE INDEX IF NOT EXISTS idx_wall_dimensions ON trajectories(wall_width, wall_height)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON trajectories(created_at)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_execution_time ON trajectories(execution_time)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_robot_actions_session ON robot_actions(session_id)')
             conn.execute('CREATE INDEX IF NOT EXISTS idx_robot_actions_type ON robot_actions(action_type)')
             conn.execute('CREATE INDEX IF NOT EXISTS idx_message_queue_status ON message_queue(status)')
-            conn.execute('CREATE INDEX IF NOT EXISTS idx_message_queue_topic ON message_queue(topic)')
+            
+            # Composite indexes serve both the filter and the ORDER BY of the
+            # /robot_actions and /messages queries; they supersede the single-column ones
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_robot_actions_session_ts ON robot_actions(session_id, timestamp)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_message_queue_topic_created ON message_queue(topic, created_at DESC)')
+            conn.execute('DROP INDEX IF EXISTS idx_robot_actions_session')
+            
+            # Covering index: /trajectories is answered from the index alone (scanned
+            # backwards), never touching the row pages that hold the trajectory blobs.
+            # id breaks ties between rows saved within the same second.
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_trajectories_listing
+                ON trajectories(created_at, id, wall_width, wall_height, total_points, execution_time)
+            ''')
+            conn.execute('DROP INDEX IF EXISTS idx_created_at')
+            conn.execute('DROP INDEX IF EXISTS idx_execution_time')
+            conn.execute('DROP INDEX IF EXISTS idx_message_queue_topic')
             
             # Create logs table for system monitoring
             conn.execute('''
@@ -94,153 +311,418 @@ class DatabaseManager:
             conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON system_logs(timestamp)')
             conn.execute('CREATE INDEX IF NOT EXISTS idx_logs_level ON system_logs(level)')
             
+            # Running totals so /system_status doesn't aggregate whole tables;
+            # seeded from existing rows the first time it is created
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS exec_stats (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    request_count INTEGER NOT NULL,
+                    total_execution_time REAL NOT NULL,
+                    trajectory_count INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                INSERT OR IGNORE INTO exec_stats (id, request_count, total_execution_time, trajectory_count)
+                SELECT 1, COUNT(execution_time), COALESCE(SUM(execution_time), 0),
+                       (SELECT COUNT(*) FROM trajectories)
+                FROM system_logs
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_trajectories_insert_count AFTER INSERT ON trajectories
+                BEGIN
+                    UPDATE exec_stats SET trajectory_count = trajectory_count + 1 WHERE id = 1;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_trajectories_delete_count AFTER DELETE ON trajectories
+                BEGIN
+                    UPDATE exec_stats SET trajectory_count = trajectory_count - 1 WHERE id = 1;
+                END
+            ''')
+            
+            # Save status of reserved ids, shared by every worker process: a row is
+            # 'queued' from reservation until its trajectory is written (then it is
+            # deleted), or 'failed'. Queued rows this old were left by a process that
+            # died before flushing; failed ones are kept for a day.
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS trajectory_saves (
+                    id INTEGER PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                UPDATE trajectory_saves SET status = 'failed', updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'queued' AND updated_at < datetime('now', '-10 minutes')
+            ''')
+            conn.execute(_SQL_PRUNE_FAILED_SAVES)
+            
+            # Make sure the AUTOINCREMENT sequence row exists so ids can be reserved up front
+            conn.execute('''
+                INSERT INTO sqlite_sequence (name, seq)
+                SELECT 'trajectories', COALESCE(MAX(id), 0) FROM trajectories
+                WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'trajectories')
+            ''')
+            
+            conn.commit()
+            
+            # Give the planner statistics for the new indexes: a full ANALYZE the
+            # first time, afterwards only what PRAGMA optimize deems worthwhile
+            has_stats = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            ).fetchone()
+            conn.execute("PRAGMA optimize" if has_stats else "ANALYZE")
             conn.commit()
             logger.info("Database initialized successfully")
 
     def save_trajectory(self, wall_width: float, wall_height: float, 
-                       obstacles: List[Dict], trajectory: List[Dict]) -> int:
-        """Save trajectory with full data"""
+                       obstacles: List[Dict], points: np.ndarray) -> int:
+        """Queue a TRAJECTORY_DTYPE array for saving and return the id it will be stored under"""
+        trajectory_id = self.reserve_trajectory_id()
+        self.trajectory_writer.append((trajectory_id, wall_width, wall_height, obstacles, points))
+        return trajectory_id
+
+    def reserve_trajectory_id(self) -> int:
+        """Allocate the next trajectories id from the AUTOINCREMENT sequence and mark it queued (safe across processes)"""
         with self.get_connection() as conn:
-            cursor = conn.execute('''
-                INSERT INTO trajectories (wall_width, wall_height, obstacles, trajectory_data, total_points)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                wall_width,
-                wall_height,
-                json.dumps(obstacles),
-                json.dumps(trajectory),
-                len(trajectory)
-            ))
-            trajectory_id = cursor.lastrowid
-            conn.commit()
-            return trajectory_id
+            with conn:
+                trajectory_id = conn.execute(_SQL_RESERVE_TRAJECTORY_ID).fetchone()[0]
+                conn.execute(_SQL_QUEUE_TRAJECTORY_SAVE, (trajectory_id,))
+        return trajectory_id
+
+    def trajectory_status(self, trajectory_id: int) -> Optional[str]:
+        """'queued', 'saved' or 'failed' for a trajectory id, None if unknown"""
+        with self.get_connection() as conn:
+            return conn.execute(_SQL_TRAJECTORY_STATUS, (trajectory_id,)).fetchone()[0]
 
     def get_trajectories(self, limit: int = 100) -> List[Dict]:
         """Retrieve trajectories with metadata"""
         with self.get_connection() as conn:
-            cursor = conn.execute('''
-                SELECT id, wall_width, wall_height, created_at, total_points, execution_time
-                FROM trajectories 
-                ORDER BY created_at DESC 
-                LIMIT ?
-            ''', (limit,))
-            return [dict(row) for row in cursor.fetchall()]
+            return rows_as_dicts(conn.execute(_SQL_GET_TRAJECTORIES, (limit,)))
 
     def log_request(self, level: str, message: str, request_id: str = None, execution_time: float = None):
-        """Log system events"""
-        with self.get_connection() as conn:
-            conn.execute('''
-                INSERT INTO system_logs (level, message, request_id, execution_time)
-                VALUES (?, ?, ?, ?)
-            ''', (level, message, request_id, execution_time))
-            conn.commit()
+        """Log system events (buffered, written in batches by the log sink)"""
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        self.log_sink.append((level, message, request_id, execution_time, timestamp))
+
+    def close(self):
+        """Flush buffered writes and close the pooled connections"""
+        self.trajectory_writer.close()
+        self.log_sink.close()
+        self.close_all()
+
+class BatchedWriter(abc.ABC):
+    """Buffer rows in memory and write them from a background thread, one transaction per batch"""
+
+    def __init__(self, db_manager: DatabaseManager, flush_size: int = 500, flush_interval: float = 0.2):
+        self.db_manager = db_manager
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._buffer: List[tuple] = []
+        self._lock = threading.Lock()
+        # Held from taking the buffer until its rows are committed, so flush()
+        # doesn't return while the flusher thread is still writing rows appended earlier
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self._flusher.start()
+
+    def append(self, row: tuple):
+        """Queue a row; a full buffer wakes the flusher early"""
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.flush_size
+        if full:
+            self._wake.set()
+
+    def flush(self, requeue: bool = True):
+        """Write all buffered rows in a single transaction
+
+        If a row is rejected, the rows are retried one per transaction so only the
+        bad ones fail. If the database is busy or locked, the rows go back to the
+        front of the buffer for the next flush (or fail, with requeue=False).
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            try:
+                self._commit(rows)
+            except sqlite3.OperationalError as e:
+                self._busy(rows, e, requeue)
+            except (sqlite3.IntegrityError, sqlite3.InterfaceError) as e:
+                if len(rows) == 1:
+                    self._failed(rows, e)
+                    return
+                # Keep one bad row from failing the rows that were batched alongside it
+                for i, row in enumerate(rows):
+                    try:
+                        self._commit([row])
+                    except sqlite3.OperationalError as e:
+                        self._busy(rows[i:], e, requeue)
+                        return
+                    except Exception as e:
+                        self._failed([row], e)
+                    else:
+                        self._written([row])
+            except Exception as e:
+                self._failed(rows, e)
+            else:
+                self._written(rows)
+
+    def close(self):
+        """Stop the background flusher and write whatever is left"""
+        self._stopped.set()
+        self._wake.set()
+        self._flusher.join()
+        self.flush(requeue=False)
+
+    def _busy(self, rows: List[tuple], error: Exception, requeue: bool):
+        if not requeue:
+            self._failed(rows, error)
+            return
+        logger.warning(f"{type(self).__name__} will retry {len(rows)} rows: {error}")
+        with self._lock:
+            self._buffer[:0] = rows
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def _commit(self, rows: List[tuple]):
+        with self.db_manager.get_connection() as conn:
+            with conn:
+                self._write(conn, rows)
+
+    @abc.abstractmethod
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]):
+        """Insert rows inside the open transaction on conn"""
+
+    def _written(self, rows: List[tuple]):
+        pass
+
+    def _failed(self, rows: List[tuple], error: Exception):
+        logger.error(f"{type(self).__name__} failed to write {len(rows)} rows: {error}")
+
+class BatchedLogSink(BatchedWriter):
+    """Batch (level, message, request_id, execution_time, timestamp) rows into system_logs"""
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]):
+        timings = [row[3] for row in rows if row[3] is not None]
+        conn.executemany(_SQL_INSERT_LOG, rows)
+        conn.execute(_SQL_UPDATE_EXEC_STATS, (len(timings), sum(timings)))
+
+class TrajectoryWriter(BatchedWriter):
+    """Batch (id, wall_width, wall_height, obstacles, points) rows into trajectories"""
+
+    def __init__(self, db_manager: DatabaseManager, flush_size: int = 50, flush_interval: float = 0.2):
+        super().__init__(db_manager, flush_size, flush_interval)
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]):
+        # Payloads are encoded here, on the writer thread, rather than in the request;
+        # both encoders return bytes, which sqlite3 binds as BLOB without a UTF-8 round-trip
+        conn.executemany(_SQL_INSERT_TRAJECTORY, [
+            (trajectory_id, wall_width, wall_height, orjson.dumps(obstacles, option=orjson.OPT_SERIALIZE_NUMPY),
+             dump_trajectory(points), len(points))
+            for trajectory_id, wall_width, wall_height, obstacles, points in rows
+        ])
+        # Stored ids report 'saved' from the trajectories table itself
+        conn.executemany(_SQL_CLEAR_TRAJECTORY_SAVE, [(row[0],) for row in rows])
+
+    def _failed(self, rows: List[tuple], error: Exception):
+        super()._failed(rows, error)
+        try:
+            with self.db_manager.get_connection() as conn:
+                with conn:
+                    conn.executemany(_SQL_FAIL_TRAJECTORY_SAVE, [(row[0],) for row in rows])
+                    conn.execute(_SQL_PRUNE_FAILED_SAVES)
+        except sqlite3.Error as e:
+            logger.error(f"Could not mark {len(rows)} trajectories as failed: {e}")
+
+class MessageWriter(BatchedWriter):
+    """Batch (topic, message, priority, status) rows into message_queue"""
+
+    def __init__(self, db_manager: DatabaseManager, flush_size: int = 100, flush_interval: float = 0.1):
+        super().__init__(db_manager, flush_size, flush_interval)
+
+    def _write(self, conn: sqlite3.Connection, rows: List[tuple]):
+        conn.executemany(_SQL_INSERT_MESSAGE, rows)
+
+class RequestLogHandler(logging.Handler):
+    """Persist request log records (those carrying an execution time) to system_logs"""
+
+    def __init__(self, db_manager: DatabaseManager, level: int = logging.INFO):
+        super().__init__(level)
+        self.db_manager = db_manager
+
+    def emit(self, record: logging.LogRecord):
+        execution_time = getattr(record, "execution_time", None)
+        if execution_time is None:
+            return
+        try:
+            self.db_manager.log_request(
+                level=record.levelname,
+                message=getattr(record, "summary", record.getMessage()),
+                request_id=getattr(record, "request_id", None),
+                execution_time=execution_time
+            )
+        except Exception:
+            self.handleError(record)
 
 class RobotActionLogger:
-    def __init__(self, db_manager: DatabaseManager):
+    MOVE_DETAILS = {
+        "MOVE_HORIZONTAL": "Moving horizontally to",
+        "MOVE_VERTICAL": "Moving vertically to",
+        "MOVE_DIAGONAL": "Moving diagonally to",
+    }
+
+    def __init__(self, db_manager: DatabaseManager, simulate_delay_s: float = 0.0):
         self.db_manager = db_manager
         self.current_session_id = None
+        # Simulated wall-clock time per trajectory point; 0 runs as fast as possible
+        self.simulate_delay_s = simulate_delay_s
     
-    def start_execution_session(self, trajectory_id: int) -> str:
+    def start_execution_session(self, trajectory_id: int) -> int:
         """Start a new robot execution session"""
-        self.current_session_id = f"session_{int(time.time() * 1000)}"
-        self.log_action("SESSION_START", f"Started trajectory execution for ID: {trajectory_id}")
-        return self.current_session_id
+        with self.db_manager.get_connection() as conn:
+            with conn:
+                session_id = conn.execute(_SQL_INSERT_SESSION, (trajectory_id,)).lastrowid
+                conn.execute(_SQL_INSERT_ACTION, (
+                    session_id, "SESSION_START", f"Started trajectory execution for ID: {trajectory_id}"
+                ))
+        self.current_session_id = session_id
+        return session_id
     
-    def log_action(self, action_type: str, details: str):
+    def log_action(self, action_type: str, details: str, session_id: Optional[int] = None):
         """Log robot actions like movement, turns, obstacles"""
         with self.db_manager.get_connection() as conn:
-            conn.execute('''
-                INSERT INTO robot_actions (session_id, action_type, details, timestamp)
-                VALUES (?, ?, ?, ?)
-            ''', (self.current_session_id, action_type, details, datetime.now().isoformat()))
+            conn.execute(_SQL_INSERT_ACTION, (session_id or self.current_session_id, action_type, details))
             conn.commit()
-        logger.info(f"Robot Action - {action_type}: {details}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Robot Action - {action_type}: {details}")
     
-    def simulate_robot_execution(self, trajectory: List[Dict]):
-        """Simulate robot execution with detailed logging"""
-        for i, point in enumerate(trajectory):
-            if i == 0:
-                self.log_action("MOVE_START", f"Starting at position ({point['x']:.2f}, {point['y']:.2f})")
-            else:
-                prev_point = trajectory[i-1]
-                
-                # Log movement type
-                if abs(point['y'] - prev_point['y']) < 0.01:
-                    self.log_action("MOVE_HORIZONTAL", f"Moving horizontally to ({point['x']:.2f}, {point['y']:.2f})")
-                elif abs(point['x'] - prev_point['x']) < 0.01:
-                    self.log_action("MOVE_VERTICAL", f"Moving vertically to ({point['x']:.2f}, {point['y']:.2f})")
-                else:
-                    self.log_action("MOVE_DIAGONAL", f"Moving diagonally to ({point['x']:.2f}, {point['y']:.2f})")
-                
-                # Log turns
-                if abs(point['angle'] - prev_point['angle']) > 0.1:
-                    self.log_action("TURN", f"Turning to angle {point['angle']:.2f} radians")
+    def log_actions_bulk(self, rows: List[tuple]):
+        """Insert many (session_id, action_type, details) rows in one transaction"""
+        if not rows:
+            return
+        with self.db_manager.get_connection() as conn:
+            with conn:
+                conn.executemany(_SQL_INSERT_ACTION, rows)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Robot Actions - logged {len(rows)} actions")
+    
+    def simulate_robot_execution(self, trajectory: np.ndarray, session_id: Optional[int] = None):
+        """Simulate robot execution, logging every action in a single batch
+
+        trajectory is a TRAJECTORY_DTYPE array (a list of point dicts is converted).
+        """
+        session_id = session_id or self.current_session_id
+        if not isinstance(trajectory, np.ndarray):
+            trajectory = trajectory_to_array(trajectory)
+        rows = []
+        if len(trajectory):
+            xs, ys, angles = trajectory["x"], trajectory["y"], trajectory["angle"]
             
-            # Simulate processing time
-            time.sleep(0.01)  # 10ms per point simulation
+            # Classify every move and turn at once from the deltas between consecutive points
+            horizontal = np.abs(np.diff(ys)) < 0.01
+            vertical = np.abs(np.diff(xs)) < 0.01
+            moves = np.where(horizontal, "MOVE_HORIZONTAL", np.where(vertical, "MOVE_VERTICAL", "MOVE_DIAGONAL"))
+            turns = np.abs(np.diff(angles)) > 0.1
+            
+            positions = [f"({x:.2f}, {y:.2f})" for x, y in zip(xs.tolist(), ys.tolist())]
+            rows.append((session_id, "MOVE_START", f"Starting at position {positions[0]}"))
+            for i, (move, turned) in enumerate(zip(moves.tolist(), turns.tolist()), start=1):
+                rows.append((session_id, move, f"{self.MOVE_DETAILS[move]} {positions[i]}"))
+                if turned:
+                    rows.append((session_id, "TURN", f"Turning to angle {angles[i]:.2f} radians"))
+        
+        self.log_actions_bulk(rows)
+        
+        # Pace the whole run in one sleep rather than one per point
+        if self.simulate_delay_s > 0:
+            time.sleep(self.simulate_delay_s * len(trajectory))
 
 class MessageBroker:
     def __init__(self, db_manager: DatabaseManager):
         self.db_manager = db_manager
+        # Lists are replaced, never changed in place, so a reader can use the one it got
         self.subscribers = {}
+        self._subscribers_lock = threading.Lock()
+        # Published messages are coalesced in memory and written every 100 ms
+        self.writer = MessageWriter(db_manager)
+        # In-process subscribers are called from here; the table only keeps the record
+        self._dispatcher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="MessageBroker")
     
     def publish(self, topic: str, message: str, priority: int = 0):
-        """Publish message to a topic"""
-        with self.db_manager.get_connection() as conn:
-            conn.execute('''
-                INSERT INTO message_queue (topic, message, priority)
-                VALUES (?, ?, ?)
-            ''', (topic, message, priority))
-            conn.commit()
+        """Publish message to a topic, handing it straight to any subscribers
+
+        The message is recorded once its subscribers have run: as processed if
+        every callback returned, otherwise as pending for process_messages.
+        """
+        with self._subscribers_lock:
+            callbacks = self.subscribers.get(topic, [])
+        if callbacks:
+            self._dispatcher.submit(self._deliver, callbacks, topic, message, priority)
+        else:
+            self.writer.append((topic, message, priority, "pending"))
         
         logger.info(f"Message published to topic '{topic}': {message}")
-        
-        # Immediately process high-priority messages
-        if priority > 5:
-            self.process_messages(topic)
     
     def subscribe(self, topic: str, callback_func):
         """Subscribe to a topic"""
-        if topic not in self.subscribers:
-            self.subscribers[topic] = []
-        self.subscribers[topic].append(callback_func)
+        with self._subscribers_lock:
+            self.subscribers[topic] = [*self.subscribers.get(topic, []), callback_func]
+    
+    def flush(self):
+        """Write any buffered messages to the queue table now"""
+        self.writer.flush()
+    
+    def close(self):
+        """Finish in-flight deliveries, then persist buffered messages"""
+        self._dispatcher.shutdown(wait=True)
+        self.writer.close()
+    
+    def _deliver(self, callbacks: List, topic: str, message: str, priority: int):
+        status = "processed"
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Error processing message on topic '{topic}': {e}")
+                status = "pending"
+        self.writer.append((topic, message, priority, status))
     
     def process_messages(self, topic: str = None):
-        """Process pending messages"""
+        """Process pending messages, including ones still buffered in memory"""
+        self.flush()
         with self.db_manager.get_connection() as conn:
             if topic:
-                cursor = conn.execute('''
-                    SELECT id, topic, message FROM message_queue 
-                    WHERE status = 'pending' AND topic = ?
-                    ORDER BY priority DESC, created_at ASC
-                ''', (topic,))
+                cursor = conn.execute(_SQL_PENDING_MESSAGES_FOR_TOPIC, (topic,))
             else:
-                cursor = conn.execute('''
-                    SELECT id, topic, message FROM message_queue 
-                    WHERE status = 'pending'
-                    ORDER BY priority DESC, created_at ASC
-                ''')
+                cursor = conn.execute(_SQL_PENDING_MESSAGES)
             
             messages = cursor.fetchall()
+            with self._subscribers_lock:
+                subscribers = dict(self.subscribers)
             
             for msg in messages:
                 msg_id, msg_topic, msg_content = msg
                 
                 # Process message with subscribers
-                if msg_topic in self.subscribers:
-                    for callback in self.subscribers[msg_topic]:
+                if msg_topic in subscribers:
+                    for callback in subscribers[msg_topic]:
                         try:
                             callback(msg_content)
                         except Exception as e:
                             logger.error(f"Error processing message {msg_id}: {e}")
-                
-                # Mark as processed
-                conn.execute('''
-                    UPDATE message_queue 
-                    SET status = 'processed', processed_at = CURRENT_TIMESTAMP
-                    WHERE id = ?
-                ''', (msg_id,))
             
+            # Mark the whole batch as processed in one statement
+            if messages:
+                conn.execute(_SQL_MARK_MESSAGES_PROCESSED, (orjson.dumps([msg[0] for msg in messages]),))
             conn.commit()
             return len(messages)
 
@@ -251,51 +733,119 @@ class CoveragePlanner:
         self.safety_margin = safety_margin
 
     def generate_coverage_pattern(self, wall_width: float, wall_height: float, 
-                                 obstacles: List[Obstacle]) -> List[TrajectoryPoint]:
-        """Generate optimized trajectory with VERTICAL passes, moving by tool width"""
-        logger.info(f"Generating VERTICAL trajectory for {wall_width}x{wall_height}m wall")
-        logger.info(f"Tool config: width={self.tool_width}m, overlap={self.overlap}m")
+                                 obstacles: np.ndarray) -> np.ndarray:
+        """Generate optimized trajectory with VERTICAL passes, moving by tool width
+
+        obstacles is an (N, 4) array of (x, y, width, height) rows.
+        """
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Generating VERTICAL trajectory for {wall_width}x{wall_height}m wall")
+            logger.debug(f"Tool config: width={self.tool_width}m, overlap={self.overlap}m")
         
-        trajectory = []
         step_size = self.tool_width - self.overlap  # Tool coverage width
+        columns = self._straight_columns(wall_width, wall_height, step_size)
         
-        x = 0  # Start from left edge
-        going_up = True  # Alternate between up and down
+        obstacles = np.asarray(obstacles, dtype=np.float64).reshape(-1, 4)
+        if not len(obstacles):
+            # Nothing to avoid: the closed-form columns are the whole trajectory
+            trajectory = columns.reshape(-1)
+        else:
+            trajectory = self._splice_obstructed_columns(columns, wall_height, obstacles)
         
-        while x < wall_width:
-            if going_up:
-                # Bottom to top pass
-                trajectory.append(TrajectoryPoint(x=x, y=0,  angle=0.0,speed=0.15,tool_active=False))
-                trajectory.extend(self._generate_optimized_line(x, 0, wall_height, 90.0, obstacles))
-            else:
-                # Top to bottom pass
-                trajectory.append(TrajectoryPoint(x=x, y=wall_height,  angle=0.0,speed=0.15,tool_active=False))
-                trajectory.extend(self._generate_optimized_line(x, wall_height, 0, 270.0, obstacles))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Generated optimized VERTICAL trajectory with {len(trajectory)} points")
+        return trajectory
 
-            x += step_size  # Move to next vertical line (by tool width)
-            going_up = not going_up  # Alternate direction
+    def _straight_columns(self, wall_width: float, wall_height: float, step_size: float) -> np.ndarray:
+        """(n_cols, 2) array of unobstructed passes, alternating up and down
+
+        Each column is two points: travel to the start, then work to the end.
+        A point's speed, angle and tool_active describe the segment that ends at it.
+        """
+        # Column count is fixed up front so x never accumulates float error
+        n_cols = math.ceil(wall_width / step_size)
+        col_index = np.arange(n_cols)
+        going_up = col_index % 2 == 0
+        y_start = np.where(going_up, 0.0, wall_height)
+        y_end = np.where(going_up, wall_height, 0.0)
+        pass_angle = np.where(going_up, 90.0, 270.0)
         
-        logger.info(f"Generated optimized VERTICAL trajectory with {len(trajectory)} points")
-        return trajectory
+        columns = np.empty((n_cols, 2), dtype=TRAJECTORY_DTYPE)
+        columns["x"] = (col_index * step_size)[:, None]
+        columns["y"] = np.column_stack([y_start, y_end])
+        columns["angle"] = np.column_stack([np.zeros(n_cols), pass_angle])
+        columns["speed"] = (0.15, 0.1)
+        columns["tool_active"] = (False, True)
+        return columns
+
+    def _splice_obstructed_columns(self, columns: np.ndarray, wall_height: float,
+                                   obstacles: np.ndarray) -> np.ndarray:
+        """Replace columns crossed by an obstacle (with safety margin) by point-by-point passes"""
+        xs = columns[:, 0]["x"]
+        left = obstacles[:, 0] - self.safety_margin
+        right = obstacles[:, 0] + obstacles[:, 2] + self.safety_margin
+        hits = (left <= xs[:, None]) & (xs[:, None] <= right)
+        blocked = np.flatnonzero(hits.any(axis=1))
+        
+        pieces = []
+        previous = 0
+        for col in blocked:
+            pieces.append(columns[previous:col].reshape(-1))
+            pieces.append(self._generate_column(xs[col], col % 2 == 0, wall_height, obstacles[hits[col]]))
+            previous = col + 1
+        pieces.append(columns[previous:].reshape(-1))
+        return np.concatenate(pieces)
+
+    def _generate_column(self, x: float, going_up: bool, wall_height: float,
+                         obstacles: np.ndarray) -> np.ndarray:
+        """Travel point plus the working pass for a column crossed by obstacles, without repeated vertices"""
+        if going_up:
+            # Bottom to top pass
+            points = [TrajectoryPoint(x=x, y=0, angle=0.0, speed=0.15, tool_active=False)]
+            points.extend(self._generate_optimized_line(x, 0, wall_height, 90.0, obstacles))
+        else:
+            # Top to bottom pass
+            points = [TrajectoryPoint(x=x, y=wall_height, angle=0.0, speed=0.15, tool_active=False)]
+            points.extend(self._generate_optimized_line(x, wall_height, 0, 270.0, obstacles))
+        column = np.array(
+            [(p.x, p.y, p.angle, p.speed, p.tool_active) for p in points],
+            dtype=TRAJECTORY_DTYPE
+        )
+        # Safety margins can reach past the wall edges; clamp before comparing so
+        # points that end up on the same edge collapse as well
+        np.clip(column["y"], 0.0, wall_height, out=column["y"])
+        # Each tool on/off switch is emitted as two points at the same spot; keep
+        # the first, whose flags describe the segment arriving there
+        keep = np.ones(len(column), dtype=bool)
+        keep[1:] = np.diff(column["y"]) != 0
+        return column[keep]
 
     # ... rest of the methods remain the same
 
     def _generate_optimized_line(self, x: float, start_y: float, end_y: float, 
-                               angle: float, obstacles: List[Obstacle]) -> List[TrajectoryPoint]:
-        """Generate optimized VERTICAL line with minimal points and tool_active flags"""
+                               angle: float, obstacles: np.ndarray) -> List[TrajectoryPoint]:
+        """Generate optimized VERTICAL line with minimal points and tool_active flags
+
+        obstacles must already be filtered to those intersecting x.
+        """
         points = []
         
         if start_y < end_y:
-            # Moving UP (bottom to top)
+            # Moving UP (bottom to top): obstacles sorted by bottom edge, so the
+            # next one above current_y is found by bisection
+            obstacles = obstacles[np.argsort(obstacles[:, 1], kind="stable")]
+            bottoms = obstacles[:, 1].tolist()
             current_y = start_y
             
             while current_y < end_y:
                 # Find next obstacle or end of line
-                next_obstacle = self._find_next_obstacle_vertical(x, current_y, obstacles, going_up=True)
+                i = bisect_right(bottoms, current_y)
+                next_obstacle = obstacles[i] if i < len(bottoms) else None
                 
-                if next_obstacle:
-                    obstacle_start = next_obstacle.y - self.safety_margin
-                    obstacle_end = next_obstacle.y + next_obstacle.height + self.safety_margin
+                if next_obstacle is not None:
+                    _, obstacle_y, _, obstacle_height = next_obstacle
+                    obstacle_start = obstacle_y - self.safety_margin
+                    obstacle_end = obstacle_y + obstacle_height + self.safety_margin
                     
                     # Add working segment before obstacle
                     if current_y < obstacle_start:
@@ -325,15 +875,22 @@ class CoveragePlanner:
                     ))
                     break
         else:
-            # Moving DOWN (top to bottom)
+            # Moving DOWN (top to bottom): obstacles sorted by top edge (earlier
+            # obstacles last among equal tops), so the next one below is found by bisection
+            tops = obstacles[:, 1] + obstacles[:, 3]
+            order = np.lexsort((-np.arange(len(obstacles)), tops))
+            obstacles = obstacles[order]
+            tops = tops[order].tolist()
             current_y = start_y
             
             while current_y > end_y:
-                next_obstacle = self._find_next_obstacle_vertical(x, current_y, obstacles, going_up=False)
+                i = bisect_left(tops, current_y) - 1
+                next_obstacle = obstacles[i] if i >= 0 else None
                 
-                if next_obstacle:
-                    obstacle_start = next_obstacle.y + next_obstacle.height + self.safety_margin
-                    obstacle_end = next_obstacle.y - self.safety_margin
+                if next_obstacle is not None:
+                    _, obstacle_y, _, obstacle_height = next_obstacle
+                    obstacle_start = obstacle_y + obstacle_height + self.safety_margin
+                    obstacle_end = obstacle_y - self.safety_margin
                     
                     # Add working segment before obstacle
                     if current_y > obstacle_start:
@@ -364,31 +921,3 @@ class CoveragePlanner:
                     break
         
         return points
-
-    def _find_next_obstacle_vertical(self, x: float, current_y: float, obstacles: List[Obstacle], 
-                                   going_up: bool) -> Optional[Obstacle]:
-        """Find the next obstacle in the current VERTICAL direction"""
-        next_obstacle = None
-        min_distance = float('inf')
-        
-        for obstacle in obstacles:
-            # Check if obstacle intersects with current x level
-            if (obstacle.x - self.safety_margin<= x <= 
-                obstacle.x + obstacle.width + self.safety_margin):
-                
-                if going_up:
-                    # Look for obstacles above
-                    if obstacle.y > current_y:
-                        distance = obstacle.y - current_y
-                        if distance < min_distance:
-                            min_distance = distance
-                            next_obstacle = obstacle
-                else:
-                    # Look for obstacles below
-                    if obstacle.y + obstacle.height < current_y:
-                        distance = current_y - (obstacle.y + obstacle.height)
-                        if distance < min_distance:
-                            min_distance = distance
-                            next_obstacle = obstacle
-        
-        return next_obstacle
\ No newline at end of file
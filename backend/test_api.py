@@ -1,14 +1,35 @@
+import gc
 import pytest
+import sqlite3
+import struct
+import threading
 import time
+import orjson
 try:
     from fastapi.testclient import TestClient
 except ImportError:
     from starlette.testclient import TestClient
-from main import app
+import numpy as np
+from main import app, db_manager
+from planner_worker import plan
+from models import TRAJECTORY_DTYPE
+from services import (
+    BatchedWriter, DatabaseManager, MessageBroker, dump_trajectory, load_trajectory, trajectory_to_array
+)
 
 # Create test client
 client = TestClient(app)
 
+def wait_until_saved(trajectory_id, timeout=3.0):
+    """Poll the save status until the background writer has stored the trajectory"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/trajectory/{trajectory_id}/status").json()["status"]
+        if status != "queued":
+            return status
+        time.sleep(0.05)
+    return "queued"
+
 class TestAPI:
     """Basic API tests for Wall-Finishing Robot Control System"""
     
@@ -72,6 +93,52 @@ class TestAPI:
         assert data["metadata"]["obstacles_count"] == 2
         assert execution_time < 5.0
     
+    def test_generate_trajectory_ndjson(self):
+        """Test NDJSON streaming of a generated trajectory"""
+        response = client.post(
+            "/generate_trajectory",
+            json={"wall_width": 2.0, "wall_height": 1.5},
+            headers={"Accept": "application/x-ndjson"}
+        )
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [orjson.loads(line) for line in response.content.splitlines()]
+        assert lines[0]["success"] is True
+        assert lines[0]["metadata"]["points_count"] == len(lines) - 1
+        assert {"x", "y", "angle", "speed", "tool_active"} <= lines[1].keys()
+    
+    def test_large_trajectory_is_compressed(self):
+        """Test that full-wall trajectories are gzip-encoded, streamed or not"""
+        for wall_width in [5.0, 100.0]:
+            response = client.post(
+                "/generate_trajectory",
+                json={"wall_width": wall_width, "wall_height": 3.0},
+                headers={"Accept-Encoding": "gzip"}
+            )
+            
+            assert response.status_code == 200
+            assert response.headers["content-encoding"] == "gzip"
+            assert response.json()["success"] is True
+    
+    def test_small_and_ndjson_trajectories_are_not_compressed(self):
+        """Test that small replies and NDJSON streams go out without gzip"""
+        small = client.post(
+            "/generate_trajectory",
+            json={"wall_width": 0.1, "wall_height": 1.0},
+            headers={"Accept-Encoding": "gzip"}
+        )
+        ndjson = client.post(
+            "/generate_trajectory",
+            json={"wall_width": 100.0, "wall_height": 3.0},
+            headers={"Accept-Encoding": "gzip", "Accept": "application/x-ndjson"}
+        )
+        
+        assert small.status_code == ndjson.status_code == 200
+        assert "content-encoding" not in small.headers
+        assert "content-encoding" not in ndjson.headers
+        assert len(small.json()["trajectory"]) == 4
+    
     def test_save_trajectory(self):
         """Test saving trajectory to database"""
         start_time = time.time()
@@ -101,11 +168,91 @@ class TestAPI:
         response = client.post("/save_trajectory", json=save_request)
         execution_time = time.time() - start_time
         
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         assert "id" in data
-        assert data["message"] == "Trajectory saved successfully"
+        assert data["status"] == "queued"
         assert execution_time < 3.0
+        assert wait_until_saved(data["id"]) == "saved"
+    
+    def test_locked_database_keeps_batch_for_next_flush(self):
+        """Test a batch that hits a locked database is kept whole and written on the next flush"""
+        class LockedOnceWriter(BatchedWriter):
+            def __init__(self, db_manager):
+                self.attempts = []
+                super().__init__(db_manager, flush_interval=60)
+            
+            def _write(self, conn, rows):
+                self.attempts.append(list(rows))
+                if len(self.attempts) == 1:
+                    raise sqlite3.OperationalError("database is locked")
+        
+        writer = LockedOnceWriter(db_manager)
+        try:
+            writer.append(("first",))
+            writer.append(("second",))
+            writer.flush()
+            writer.append(("third",))
+            writer.flush()
+            # One failed batch attempt, no row-by-row retries, then everything in order
+            assert writer.attempts == [[("first",), ("second",)], [("first",), ("second",), ("third",)]]
+        finally:
+            writer.close()
+    
+    def test_flush_waits_for_background_write(self):
+        """Test flush() returns only after rows taken by the flusher thread are committed"""
+        class SlowWriter(BatchedWriter):
+            def __init__(self, db_manager):
+                self.started = threading.Event()
+                self.committed = []
+                super().__init__(db_manager, flush_interval=0.01)
+            
+            def _write(self, conn, rows):
+                self.started.set()
+                time.sleep(0.2)
+                self.committed.extend(rows)
+        
+        writer = SlowWriter(db_manager)
+        try:
+            writer.append(("row",))
+            assert writer.started.wait(1.0)
+            writer.flush()
+            assert writer.committed == [("row",)]
+        finally:
+            writer.close()
+    
+    def test_exited_threads_release_connections(self):
+        """Test pooled connections of finished threads are closed rather than kept open"""
+        connections = []
+        def query():
+            with db_manager.get_connection() as conn:
+                conn.execute("SELECT 1")
+                connections.append(conn)
+        
+        for _ in range(20):
+            thread = threading.Thread(target=query)
+            thread.start()
+            thread.join()
+        del thread
+        gc.collect()
+        
+        for conn in connections:
+            with pytest.raises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+    
+    def test_trajectory_status_shared_across_processes(self):
+        """Test a queued save is visible to a DatabaseManager of another worker process"""
+        trajectory_id = db_manager.reserve_trajectory_id()
+        other_worker = DatabaseManager(db_manager.db_path)
+        try:
+            assert other_worker.trajectory_status(trajectory_id) == "queued"
+        finally:
+            other_worker.close()
+    
+    def test_trajectory_status_not_found(self):
+        """Test status polling for an id that was never saved"""
+        response = client.get("/trajectory/999999999/status")
+        assert response.status_code == 404
     
     def test_get_trajectories(self):
         """Test retrieving saved trajectories"""
@@ -146,6 +293,106 @@ class TestAPI:
         # Should handle gracefully (either 422 validation error or 500 with error message)
         assert response.status_code in [422, 500]
     
+    def test_invalid_save_request(self):
+        """Test saving a trajectory with non-positive wall dimensions"""
+        invalid_request = {
+            "wall_width": 0.0,
+            "wall_height": 2.0,
+            "obstacles": [],
+            "trajectory": []
+        }
+        
+        response = client.post("/save_trajectory", json=invalid_request)
+        assert response.status_code == 422
+    
+    def test_save_trajectory_point_missing_coordinate(self):
+        """Test saving a trajectory whose point lacks a coordinate is rejected up front"""
+        invalid_request = {
+            "wall_width": 1.0,
+            "wall_height": 1.0,
+            "obstacles": [],
+            "trajectory": [{"x": 0.0, "y": 0.0}, {"y": 0.5}]
+        }
+        
+        response = client.post("/save_trajectory", json=invalid_request)
+        assert response.status_code == 422
+    
+    def test_failed_row_does_not_fail_its_batch(self):
+        """Test the trajectory writer stores the good rows of a batch containing a bad one"""
+        points = trajectory_to_array([{"x": 0.0, "y": 0.0}, {"x": 0.0, "y": 1.0}])
+        writer = db_manager.trajectory_writer
+        ids = [db_manager.reserve_trajectory_id() for _ in range(3)]
+        # The middle row breaks the wall_width CHECK when the batch is written
+        for trajectory_id, wall_width in zip(ids, [1.0, -1.0, 1.0]):
+            writer.append((trajectory_id, wall_width, 1.0, [], points))
+        writer.flush()
+        
+        statuses = [db_manager.trajectory_status(trajectory_id) for trajectory_id in ids]
+        assert statuses == ["saved", "failed", "saved"]
+    
+    def test_execute_trajectory(self):
+        """Test execution returns immediately and logs robot actions"""
+        save_request = {
+            "wall_width": 1.0,
+            "wall_height": 1.0,
+            "obstacles": [],
+            "trajectory": [
+                {"x": 0.0, "y": 0.0, "angle": 0.0, "speed": 0.15, "tool_active": False},
+                {"x": 0.0, "y": 1.0, "angle": 90.0, "speed": 0.1, "tool_active": True},
+                {"x": 0.08, "y": 1.0, "angle": 0.0, "speed": 0.15, "tool_active": False}
+            ]
+        }
+        trajectory_id = client.post("/save_trajectory", json=save_request).json()["id"]
+        assert wait_until_saved(trajectory_id) == "saved"
+        
+        response = client.post(f"/execute_trajectory/{trajectory_id}")
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "running"
+        assert data["total_points"] == 3
+        assert isinstance(data["session_id"], int)
+        
+        actions = client.get(f"/robot_actions/{data['session_id']}").json()
+        assert actions["total_actions"] > 0
+    
+    def test_execute_legacy_json_trajectory(self):
+        """Test execution of a trajectory stored as JSON text before the binary format"""
+        legacy_points = [
+            {"x": 0.0, "y": 0.0, "angle": 0.0, "speed": 0.15, "tool_active": False},
+            {"x": 0.0, "y": 1.0, "angle": 90.0, "speed": 0.1, "tool_active": True}
+        ]
+        with db_manager.get_connection() as conn:
+            with conn:
+                trajectory_id = conn.execute(
+                    "INSERT INTO trajectories (wall_width, wall_height, obstacles, trajectory_data, total_points) "
+                    "VALUES (1.0, 1.0, '[]', ?, 2)",
+                    (orjson.dumps(legacy_points).decode(),)
+                ).lastrowid
+        
+        response = client.post(f"/execute_trajectory/{trajectory_id}")
+        
+        assert response.status_code == 200
+        assert response.json()["total_points"] == 2
+    
+    def test_failed_delivery_stays_pending(self):
+        """Test a message is stored as processed only after every subscriber returned"""
+        def failing_subscriber(message):
+            raise RuntimeError("subscriber down")
+        
+        broker = MessageBroker(db_manager)
+        broker.subscribe("test_delivery_ok", lambda message: None)
+        broker.subscribe("test_delivery_failed", failing_subscriber)
+        broker.publish("test_delivery_ok", "first")
+        broker.publish("test_delivery_failed", "second")
+        broker.close()
+        
+        with db_manager.get_connection() as conn:
+            statuses = dict(conn.execute(
+                "SELECT topic, status FROM message_queue WHERE topic LIKE 'test_delivery_%'"
+            ).fetchall())
+        assert statuses == {"test_delivery_ok": "processed", "test_delivery_failed": "pending"}
+    
     def test_get_messages(self):
         """Test message retrieval endpoint"""
         start_time = time.time()
@@ -204,8 +451,9 @@ class TestCRUDOperations:
         }
         
         save_response = client.post("/save_trajectory", json=save_request)
-        assert save_response.status_code == 200
+        assert save_response.status_code == 202
         trajectory_id = save_response.json()["id"]
+        assert wait_until_saved(trajectory_id) == "saved"
         
         # READ: Retrieve trajectories
         get_response = client.get("/trajectories?limit=1")
@@ -217,6 +465,125 @@ class TestCRUDOperations:
         found_trajectory = any(t["id"] == trajectory_id for t in trajectories)
         assert found_trajectory
 
+class TestPlanner:
+    """Test the coverage planner output directly"""
+    
+    def assert_valid_trajectory(self, points, wall_width, wall_height, obstacles, safety_margin):
+        xs, ys = points["x"], points["y"]
+        assert ((0 <= xs) & (xs <= wall_width) & (0 <= ys) & (ys <= wall_height)).all()
+        # No vertex is emitted twice in a row
+        assert not ((np.diff(xs) == 0) & (np.diff(ys) == 0)).any()
+        # The tool is off on every segment crossing an obstacle or its margin
+        for i in np.flatnonzero(points["tool_active"][1:]) + 1:
+            low, high = sorted((ys[i - 1], ys[i]))
+            for x, y, width, height in obstacles:
+                if x - safety_margin <= xs[i] <= x + width + safety_margin:
+                    assert high <= y - safety_margin + 1e-9 or low >= y + height + safety_margin - 1e-9
+    
+    def test_obstacle_margin_past_wall_edge(self):
+        """Test an obstacle whose margin reaches below the wall yields no repeated vertices"""
+        obstacles = np.array([[0.0, 0.02, 0.3, 0.3]])
+        points = plan(1.0, 1.0, obstacles, 0.1, 0.02, 0.05)
+        
+        self.assert_valid_trajectory(points, 1.0, 1.0, obstacles, 0.05)
+        # The obstructed columns start working above the obstacle
+        assert points[1]["y"] == pytest.approx(0.37) and not points[1]["tool_active"]
+    
+    def test_random_walls(self):
+        """Test planner invariants over random walls with random obstacles"""
+        rng = np.random.default_rng(7)
+        for _ in range(50):
+            wall_width, wall_height = rng.uniform(1.0, 5.0, size=2)
+            # One obstacle per horizontal band, so obstacles (with margins) never overlap vertically
+            n = rng.integers(1, 5)
+            band = wall_height / n
+            heights = rng.uniform(0.02, band - 0.12, size=n)
+            ys = band * np.arange(n) + 0.055 + rng.uniform(0.0, 1.0, size=n) * (band - 0.11 - heights)
+            widths = rng.uniform(0.05, 0.8, size=n)
+            xs = rng.uniform(0.0, 1.0, size=n) * (wall_width - widths)
+            obstacles = np.column_stack([xs, ys, widths, heights])
+            points = plan(wall_width, wall_height, obstacles, 0.1, 0.02, 0.05)
+            
+            self.assert_valid_trajectory(points, wall_width, wall_height, obstacles, 0.05)
+
+class TestTrajectoryStorage:
+    """Test the stored trajectory formats round-trip through load_trajectory"""
+    
+    def sample_points(self):
+        rng = np.random.default_rng(3)
+        # 11 points, so the packed tool_active bits don't fill whole bytes
+        points = np.empty(11, dtype=TRAJECTORY_DTYPE)
+        points["x"] = rng.uniform(0.0, 5.0, size=11)
+        points["y"] = rng.uniform(0.0, 3.0, size=11)
+        points["angle"] = rng.choice([0.0, 90.0, 270.0], size=11)
+        points["speed"] = rng.choice([0.1, 0.15, 0.2], size=11)
+        points["tool_active"] = rng.random(11) < 0.5
+        return points
+    
+    def assert_close(self, loaded, points):
+        assert loaded.dtype == TRAJECTORY_DTYPE
+        np.testing.assert_allclose(loaded["x"], points["x"], atol=0.5e-4)
+        np.testing.assert_allclose(loaded["y"], points["y"], atol=0.5e-4)
+        np.testing.assert_allclose(loaded["angle"], points["angle"], atol=0.05)
+        np.testing.assert_allclose(loaded["speed"], points["speed"], atol=0.5e-3)
+        assert (loaded["tool_active"] == points["tool_active"]).all()
+    
+    def test_current_format_round_trip(self):
+        """Test TRJ3 (deflated fixed-point columns) keeps the quantization precision"""
+        points = self.sample_points()
+        blob = dump_trajectory(points)
+        
+        assert blob[:4] == b"TRJ3"
+        self.assert_close(load_trajectory(blob), points)
+    
+    def test_uncompressed_fixed_point_format(self):
+        """Test TRJ2 blobs (fixed-point columns without deflate) still load"""
+        points = self.sample_points()
+        columns = [
+            np.rint(points[name] * scale).astype(dtype).tobytes()
+            for name, scale, dtype in [("x", 1e4, "<i4"), ("y", 1e4, "<i4"), ("angle", 10, "<i2"), ("speed", 1e3, "<u2")]
+        ]
+        blob = struct.pack("<4sI", b"TRJ2", len(points)) + b"".join(columns) + np.packbits(points["tool_active"]).tobytes()
+        
+        self.assert_close(load_trajectory(blob), points)
+    
+    def test_float_column_format(self):
+        """Test TRJ1 blobs (float64 columns) load exactly"""
+        points = self.sample_points()
+        columns = [points[name].astype("<f8").tobytes() for name in ["x", "y", "angle", "speed"]]
+        blob = struct.pack("<4sI", b"TRJ1", len(points)) + b"".join(columns) + np.packbits(points["tool_active"]).tobytes()
+        
+        assert (load_trajectory(blob) == points).all()
+    
+    def test_json_formats(self):
+        """Test JSON trajectories load from BLOB (bytes) and TEXT (str) columns, with point defaults"""
+        points = self.sample_points()
+        fields = points.dtype.names
+        encoded = orjson.dumps([dict(zip(fields, point)) for point in points.tolist()])
+        
+        assert (load_trajectory(encoded) == points).all()
+        assert (load_trajectory(encoded.decode()) == points).all()
+        
+        defaults = load_trajectory('[{"x": 1.0, "y": 2.0}]')
+        assert defaults[0].tolist() == (1.0, 2.0, 0.0, 0.1, True)
+    
+    def test_out_of_range_values_are_clipped(self):
+        """Test values beyond a fixed-point column's range are stored at its limits"""
+        points = np.zeros(3, dtype=TRAJECTORY_DTYPE)
+        points["x"] = [1e6, -1e6, 0.0]
+        points["angle"] = [5000.0, -5000.0, 0.0]
+        points["speed"] = [-1.0, 100.0, 0.0]
+        loaded = load_trajectory(dump_trajectory(points))
+        
+        np.testing.assert_allclose(loaded["x"], [214748.3647, -214748.3648, 0.0])
+        np.testing.assert_allclose(loaded["angle"], [3276.7, -3276.8, 0.0])
+        np.testing.assert_allclose(loaded["speed"], [0.0, 65.535, 0.0])
+    
+    def test_unknown_format_version(self):
+        """Test a TRJ blob of an unknown version is rejected"""
+        with pytest.raises(ValueError):
+            load_trajectory(struct.pack("<4sI", b"TRJ9", 0))
+
 class TestPerformance:
     """Test response time requirements"""
     
@@ -135,7 +135,8 @@ const CanvasVisualization = ({
 
       if (currentToolActive !== toolActive && currentSegment.length > 0) {
         segments.push({ points: currentSegment, toolActive: currentToolActive });
-        currentSegment = [point];
+        // A point's tool_active describes the segment arriving at it, so start from the previous vertex
+        currentSegment = [currentSegment[currentSegment.length - 1], point];
         currentToolActive = toolActive;
       } else {
         currentSegment.push(point);